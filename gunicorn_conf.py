@@ -0,0 +1,9 @@
+# Gunicorn settings for running Hunter AI outside Vercel:  gunicorn -c gunicorn_conf.py main:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = os.cpu_count() or 2
+worker_class = 'gthread'
+threads = 8
+timeout = 120 # A 5y WEEKLY scan of the whole market list can take well over the default 30s.
+preload_app = True # Import main (and, with Numba installed, JIT the backtest kernel) once in the master, not per worker.
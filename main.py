@@ -1,14 +1,32 @@
 # DIRECT STRIKE PROTOCOL - The Last Stand. No Proxies.
 from flask import Flask, render_template, redirect, url_for, Response, request
-import yfinance as yf
-import pandas as pd
 import os
 import time
 from datetime import datetime
 import numpy as np
 import io
+import hashlib
+import tempfile
+import stat
+import fcntl
+import csv
+import json
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import pytz
+from curl_cffi import requests as curl_requests
+os.environ.setdefault('NUMBA_CACHE_DIR', '/tmp/numba_cache') # The deployed source tree is read-only on Vercel.
+try:
+    from numba import njit
+except ImportError: # Numba is optional (kept out of requirements.txt for the Vercel bundle): run the kernels as plain Python, same results.
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs: return args[0]
+        return lambda f: f
+
+# yfinance and pandas are imported inside the functions that need them: together they take most of a
+# second to import, and a Vercel cold start that only serves / or a static page should not pay for that.
 
 # ================= Logging Setup =================
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,51 +39,341 @@ app = Flask(__name__)
 # ================= 1. Core Files & Helper Logic (Vercel Compatible) =================
 WATCHLIST_FILE = "/tmp/我的自選清單.txt"
 MARKET_SCAN_LIST_FILE = "/tmp/market_scan_list.txt"
-GENE_CACHE_FILE = "/tmp/基因快取.csv"
+GENE_CACHE_FILE = "/tmp/基因快取.json"
+STATIC_NAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "tw_names.csv") # Shipped, read-only.
+ANALYSIS_WORKERS = min(16, (os.cpu_count() or 1) * 2) # weekly_battle releases the GIL, so analysis scales with cores.
+DOWNLOAD_CACHE_DIR = "/tmp/ydl_cache"
+DOWNLOAD_CACHE_TTL = {'5y': 24 * 3600, 'default': 15 * 60} # 5y backtest history barely moves intraday.
+RUN_CACHE_TTL = 120 # Seconds a finished scan is reused, e.g. by /download right after /run.
+
+# One shared HTTP session for Yahoo downloads, so TLS handshakes are paid
+# once per connection instead of once per call. curl_cffi keeps a curl handle per thread, so it is safe
+# to share across yfinance's download threads.
+YF_SESSION = curl_requests.Session(impersonate="chrome")
+
+try:
+    TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+except Exception as e:
+    logging.warning(f"pytz lookup for Taipei time failed: {e}. Falling back to server time.")
+    TAIPEI_TZ = None
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
 
 def get_taipei_time_str():
-    try:
-        taipei_tz = pytz.timezone('Asia/Taipei')
-        now_utc = datetime.utcnow().replace(tzinfo=pytz.utc)
-        now_taipei = now_utc.astimezone(taipei_tz)
-        return now_taipei.strftime('%Y-%m-%d %H:%M:%S %Z')
-    except Exception as e:
-        logging.warning(f"pytz lookup for Taipei time failed: {e}. Falling back to server time.")
+    if TAIPEI_TZ is None:
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S (Local)')
+    return datetime.now(TAIPEI_TZ).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+SECTOR_MAP = {
+    '3481': "[面板]", '2409': "[面板]",
+    '3260': "[記憶體]", '2408': "[記憶體]", '8299': "[記憶體]",
+    '1513': "[重電]", '1519': "[重電]", '1503': "[重電]",
+    '2330': "[AI核心]", '2454': "[AI核心]", '3017': "[AI核心]", '2317': "[AI核心]",
+}
 
 def get_sector_label(t):
-    c = t.split('.')[0]
-    if c in ['3481', '2409']: return "[面板]"
-    if c in ['3260', '2408', '8299']: return "[記憶體]"
-    if c in ['1513', '1519', '1503']: return "[重電]"
-    if c in ['2330', '2454', '3017', '2317']: return "[AI核心]"
-    return "[熱門]"
+    return SECTOR_MAP.get(t.partition('.')[0], "[熱門]")
+
+def _load_static_names():
+    try:
+        with open(STATIC_NAMES_FILE, "r", encoding="utf-8", newline="") as f:
+            return {row['code']: row['name'] for row in csv.DictReader(f)}
+    except FileNotFoundError:
+        return {}
+
+_static_names = _load_static_names()
+
+def get_stock_name(t):
+    """Display name from the shipped table, else the ticker itself. Local only: the watchlist page makes no network calls."""
+    return _static_names.get(t.split('.', 1)[0], t)
+
+def _write_json_atomic(path, obj):
+    """Dump to a unique temp file beside path, then swap it in: concurrent writers (threads or
+    Gunicorn workers) never share a temp file, and readers never see a half-written one."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f: json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Gene cache: ticker -> {'best_p': int, 'fit': str}, rewritten by WEEKLY scans. Kept in memory and
+# re-read only when the file changes, e.g. after another Gunicorn worker saved a WEEKLY run.
+_gene_cache, _gene_cache_stamp = {}, None
+_gene_cache_lock = threading.Lock()
+
+def load_gene_cache():
+    global _gene_cache, _gene_cache_stamp
+    with _gene_cache_lock:
+        stamp = _file_stamp(GENE_CACHE_FILE)
+        if stamp != _gene_cache_stamp:
+            try:
+                with open(GENE_CACHE_FILE, "r", encoding="utf-8") as f: _gene_cache = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                _gene_cache = {}
+            _gene_cache_stamp = stamp
+        return _gene_cache
+
+def save_gene_cache(entries):
+    global _gene_cache, _gene_cache_stamp
+    with open(f"{GENE_CACHE_FILE}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX) # Serialise read-merge-write across Gunicorn workers, not just threads.
+        cache = load_gene_cache() # Merge into the latest on-disk state, not a stale in-memory copy.
+        changed = {t: e for t, e in entries.items() if cache.get(t) != e}
+        if not changed: return
+        with _gene_cache_lock:
+            updated = {**_gene_cache, **changed} # New dict: scans still holding the old one are unaffected.
+            _write_json_atomic(GENE_CACHE_FILE, updated)
+            _gene_cache, _gene_cache_stamp = updated, _file_stamp(GENE_CACHE_FILE)
+
+_persist_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gene-cache")
+
+def _persist_gene_cache(entries):
+    try:
+        save_gene_cache(entries)
+    except Exception as e: # Nobody waits on this future, so log rather than lose the error.
+        logging.error(f"Gene cache save failed: {e}")
+
+_list_cache = {}
+
+def _parse_ticker_lines(lines):
+    return tuple(l.strip() for l in lines if l.strip() and not l.startswith("#"))
+
+def load_ticker_list(path):
+    """Tickers in a list file (blank and # lines skipped). Re-parsed only when the file changes."""
+    stamp = _file_stamp(path)
+    cached = _list_cache.get(path)
+    if cached is None or cached[0] != stamp:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (stamp, _parse_ticker_lines(f))
+        _list_cache[path] = cached
+    return list(cached[1])
 
 def init_system_files():
     if not os.path.exists(MARKET_SCAN_LIST_FILE):
         default_list = ["^TWII", "3481.TW", "2409.TW", "3260.TWO", "2408.TW", "1513.TW", "1519.TW", "2330.TW", "2317.TW", "3017.TW", "2454.TW"]
         with open(MARKET_SCAN_LIST_FILE, "w", encoding="utf-8") as f:
             f.write("\n".join(default_list))
-    if not os.path.exists(GENE_CACHE_FILE):
-        pd.DataFrame(columns=['ticker', 'best_p', 'fit']).to_csv(GENE_CACHE_FILE, index=False)
+
+def ensure_list_file(mode):
+    """The list file a scan mode reads, created empty if missing."""
+    list_file = MARKET_SCAN_LIST_FILE if mode.startswith('MARKET') or mode == 'QUICK_SCAN' else WATCHLIST_FILE
+    if not os.path.exists(list_file):
+        with open(list_file, "w", encoding="utf-8") as f: f.write("# 請在此輸入您的自選股\n")
+    return list_file
 
 # ================= 2. Core Engine (DIRECT STRIKE PROTOCOL) =================
+# Explicit signature: compiled eagerly at import (or loaded from NUMBA_CACHE_DIR), never on a request.
+@njit('Tuple((int64, float64, float64))(float64[::1], int64[::1])', cache=True, fastmath=True, nogil=True)
+def weekly_battle(close, ps):
+    """Pick the MA period whose hold-while-Close>MA strategy ends with the most capital (from 100).
+    Single pass per period with a running MA sum; 0.4% cost per round trip. Returns (-1, 0.0) if
+    the history is shorter than every period. Also returns the winner's MA on the last bar, so the
+    caller does not need another rolling pass."""
+    n = close.shape[0]
+    best_p, best_cap, best_ma = -1, 0.0, np.nan
+    for k in range(ps.shape[0]):
+        p = ps[k]
+        if n < p: continue
+        run = 0.0
+        for i in range(p): run += close[i]
+        above_prev = close[p - 1] > run / p
+        entry, log_cap = 0.0, 0.0 # Compound in log space so long trade runs cannot overflow.
+        for i in range(p, n):
+            run += close[i] - close[i - p]
+            above = close[i] > run / p
+            if above and not above_prev:
+                entry = close[i]
+            elif above_prev and not above and entry > 0.0: # An exit with no prior entry is ignored.
+                log_cap += np.log1p((close[i] - entry) / entry - 0.004)
+                entry = 0.0
+            above_prev = above
+        if above_prev and entry > 0.0: # Mark the open position to the last close.
+            log_cap += np.log1p((close[n - 1] - entry) / entry - 0.004)
+        cap = 100.0 * np.exp(log_cap)
+        if best_p < 0 or cap > best_cap: best_p, best_cap, best_ma = p, cap, run / p
+    return best_p, best_cap, best_ma
+
+BATTLE_PERIODS = np.array([10, 20, 60], dtype=np.int64)
+
+PRICE_COLUMNS = ['Open', 'Low', 'Close', 'Volume']
+
+def split_price_arrays(all_data, targets):
+    """Convert the wide download to one float64 block and slice it into per-ticker PRICE_COLUMNS
+    arrays, dropping bars with a gap in any of them. Returns {ticker: (open, low, close, volume)},
+    with None for a ticker the download does not contain."""
+    import pandas as pd
+    cols = all_data.columns
+    if isinstance(cols, pd.MultiIndex): # (Ticker, Price) when grouped by ticker; (Price, Ticker) for a lone ticker.
+        ticker_first = cols.get_level_values(0).isin(targets).any()
+        pos = {(a, b) if ticker_first else (b, a): i for i, (a, b) in enumerate(cols)}
+    else:
+        pos = {(targets[0], c): i for i, c in enumerate(cols)}
+    block = all_data.to_numpy(dtype=np.float64)
+
+    arrays = {}
+    for t in targets:
+        idx = [pos.get((t, f)) for f in PRICE_COLUMNS]
+        if None in idx:
+            arrays[t] = None
+            continue
+        bars = block[:, idx]
+        bars = bars[~np.isnan(bars).any(axis=1)] # Only the columns the analysis reads; ignore gaps in High/Adj Close.
+        arrays[t] = tuple(np.ascontiguousarray(bars[:, k]) for k in range(len(PRICE_COLUMNS)))
+    return arrays
+
+def analyze_ticker(ticker, arrays, mode, analysis_mode, gene_cache):
+    """Analyse one ticker's (open, low, close, volume) arrays from split_price_arrays. Returns
+    (result row or None if filtered out by QUICK_SCAN, gene-cache entry or None). Never raises:
+    failures become an error row."""
+    try:
+        if arrays is None: raise ValueError("No data downloaded for this ticker.")
+        open_, low, close, vol = arrays
+        if len(close) == 0: raise ValueError("No complete price bars after dropping NaNs.")
+
+        if mode == 'QUICK_SCAN':
+            if len(close) < 2: return None, None
+            is_red = close[-1] > open_[-1]
+            is_volume_up = vol[-1] > (vol[-2] * 1.2)
+            if not (is_red and is_volume_up): return None, None
+
+        last_p = float(close[-1])
+        best_p, fit_val, cache_entry, ma_val = 20, "N/A", None, None
+
+        if analysis_mode == 'WEEKLY':
+            if len(close) < BATTLE_PERIODS.min(): # Shorter than every battle period, e.g. a new listing.
+                fit_val = "數據不足"
+            else:
+                best_p, f_raw, ma_val = weekly_battle(close, BATTLE_PERIODS)
+                fit_val = f"{f_raw-100:.1f}%"
+                cache_entry = {'best_p': int(best_p), 'fit': fit_val}
+        else: # DAILY
+            cached = gene_cache.get(ticker)
+            if cached:
+                best_p, fit_val = int(cached['best_p']), cached['fit']
+        if ma_val is None: # Only the last MA value is needed.
+            ma_val = close[-best_p:].mean() if len(close) >= best_p else np.nan
+
+        low_20 = low[-20:].min()
+        target_1382 = round(low_20 + (last_p - low_20) * 1.382, 2)
+        status = "✅強勢" if last_p > ma_val else "❌弱勢"
+        is_red_signal = last_p > open_[-1]
+        signal = "🟢🟢 埋伏" if (is_red_signal and len(vol) > 1 and vol[-1] > vol[-2] and status == "✅強勢") else "⚪ 觀察"
+        sector = get_sector_label(ticker)
+
+        return {"name": f"{sector}{ticker}", "p": f"{best_p}d", "fit": fit_val,
+                "price": f"{last_p:.1f}", "target": target_1382, "status": status,
+                "signal": signal, "sector": sector}, cache_entry
+
+    except Exception as e:
+        logging.error(f"ANALYSIS ERROR on {ticker}: {e}", exc_info=False)
+        return {"name": f"分析失敗: {ticker}", "p": "N/A", "fit": "N/A", "price": "N/A", "target": "N/A", "status": "🔴 錯誤", "signal": "Data Error", "order_error": str(e), "sector": "ERROR"}, None
+
+def _private_cache_dir():
+    """True if DOWNLOAD_CACHE_DIR is a real directory owned by us that no one else can write to.
+    Pickles run code when loaded, so a directory another local user could plant files in is never used."""
+    try:
+        os.makedirs(DOWNLOAD_CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(DOWNLOAD_CACHE_DIR)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+            logging.warning(f"Download cache disabled: {DOWNLOAD_CACHE_DIR} is not a private directory owned by this user.")
+            return False
+        if st.st_mode & 0o077: os.chmod(DOWNLOAD_CACHE_DIR, 0o700) # Tighten a dir left by an older build.
+        return True
+    except OSError as e:
+        logging.warning(f"Download cache disabled: {e}")
+        return False
+
+def _download_cache_path(targets, period):
+    day = datetime.now(TAIPEI_TZ).strftime('%Y%m%d') # Roll the key at Taipei midnight so a new session's bar is never served from yesterday's file.
+    key = hashlib.sha1(f"{','.join(sorted(targets))}|{period}|{day}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DOWNLOAD_CACHE_DIR, f"{key}.pkl")
+
+def _read_fresh_download(path, ttl):
+    import pandas as pd
+    cached_at = _mtime(path)
+    if not cached_at or time.time() - cached_at >= ttl: return None
+    try:
+        return pd.read_pickle(path)
+    except Exception as e:
+        logging.warning(f"Discarding unreadable download cache {path}: {e}")
+        return None
+
+def download_history(targets, period):
+    """yf.download for all targets at once, behind a short-lived pickle cache in /tmp so repeated
+    scans of the same list do not hit Yahoo again. Empty downloads are never cached."""
+    import yfinance as yf
+    use_cache = _private_cache_dir()
+    path = _download_cache_path(targets, period)
+    ttl = DOWNLOAD_CACHE_TTL.get(period, DOWNLOAD_CACHE_TTL['default'])
+    cached = _read_fresh_download(path, ttl) if use_cache else None
+    if cached is not None:
+        logging.info(f"Using cached download for {len(targets)} targets with period '{period}'.")
+        return cached
+
+    logging.info(f"Executing DIRECT STRIKE download for {len(targets)} targets with period '{period}'...")
+    all_data = yf.download(
+        tickers=targets,
+        period=period,
+        auto_adjust=False,
+        proxy=None, # DIRECT STRIKE: No proxy is used.
+        timeout=60,
+        threads=True,
+        progress=False,
+        session=YF_SESSION,
+        group_by='ticker' if len(targets) > 1 else None
+    )
+    if use_cache and not all_data.empty:
+        tmp_path = None
+        try: # A failed cache write must never turn a good download into error rows.
+            fd, tmp_path = tempfile.mkstemp(dir=DOWNLOAD_CACHE_DIR, suffix=".tmp") # Unique per writer: concurrent scans of one list must not share a temp file.
+            os.close(fd)
+            all_data.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+            max_age = max(DOWNLOAD_CACHE_TTL.values())
+            for name in os.listdir(DOWNLOAD_CACHE_DIR): # Day-keyed files from earlier sessions are dead weight in /tmp.
+                old = os.path.join(DOWNLOAD_CACHE_DIR, name)
+                if time.time() - (_mtime(old) or time.time()) > max_age:
+                    try: os.remove(old)
+                    except OSError: pass
+        except OSError as e:
+            logging.warning(f"Could not write download cache {path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                try: os.remove(tmp_path)
+                except OSError: pass
+    return all_data
+
+def quick_scan_candidates(all_data, targets):
+    """Vectorised 紅K帶量 filter over the wide multi-ticker download: keep tickers whose last bar
+    closes above its open on more than 1.2x the previous volume. Tickers with a gap in the last two
+    rows are kept too, so analyze_ticker can apply the exact check on their own last valid bars."""
+    tail = all_data.iloc[-2:]
+    if len(tail) < 2: return targets
+    o, l, c, v = (tail.xs(f, axis=1, level=1).reindex(columns=targets).to_numpy(dtype=np.float64) for f in PRICE_COLUMNS)
+    passed = (c[-1] > o[-1]) & (v[-1] > v[-2] * 1.2)
+    gaps = np.isnan(np.stack([o, l, c, v])).any(axis=(0, 1))
+    return [t for t, keep in zip(targets, passed | gaps) if keep]
+
 def run_stable_hunter(mode='DAILY'):
     init_system_files()
     scan_time = get_taipei_time_str()
     analysis_mode = 'WEEKLY' if mode in ['MARKET_BACKTEST', 'WEEKLY'] else 'DAILY'
-    is_market_scan = mode.startswith('MARKET') or mode == 'QUICK_SCAN'
+    list_file = ensure_list_file(mode)
 
-    if mode == 'QUICK_SCAN':
-        list_file = MARKET_SCAN_LIST_FILE
-    else:
-        list_file = MARKET_SCAN_LIST_FILE if is_market_scan else WATCHLIST_FILE
-
-    if not os.path.exists(list_file):
-        with open(list_file, "w", encoding="utf-8") as f: f.write("# 請在此輸入您的自選股\n")
-
-    with open(list_file, "r", encoding="utf-8") as f:
-        targets = [l.strip() for l in f if l.strip() and not l.startswith("#")]
+    targets = load_ticker_list(list_file)
     
     if len(targets) > 1 and "^TWII" in targets:
         targets.remove("^TWII")
@@ -75,23 +383,10 @@ def run_stable_hunter(mode='DAILY'):
         logging.warning("No targets found for analysis. Returning empty results.")
         return [], scan_time, analysis_mode, list_file
 
-    try:
-        cache_df = pd.read_csv(GENE_CACHE_FILE).set_index('ticker')
-    except (FileNotFoundError, pd.errors.EmptyDataError):
-        cache_df = pd.DataFrame(columns=['ticker', 'best_p', 'fit']).set_index('ticker')
-
     period = "5y" if analysis_mode == 'WEEKLY' else ("2d" if mode == 'QUICK_SCAN' else "60d")
     all_data = None
     try:
-        logging.info(f"Executing DIRECT STRIKE download for {len(targets)} targets with period '{period}'...")
-        all_data = yf.download(
-            tickers=targets,
-            period=period,
-            auto_adjust=False,
-            proxy=None, # DIRECT STRIKE: No proxy is used.
-            timeout=60,
-            group_by='ticker' if len(targets) > 1 else None
-        )
+        all_data = download_history(targets, period)
         if all_data.empty:
             raise ValueError("yf.download returned an empty DataFrame. Vercel\'s native IP may be blocked or rate-limited.")
         logging.info("DIRECT STRIKE download successful.")
@@ -100,85 +395,54 @@ def run_stable_hunter(mode='DAILY'):
         error_results = [{"name": f"分析失敗: {t}", "p": "N/A", "fit": "N/A", "price": "N/A", "target": "N/A", "status": "🔴 錯誤", "signal": "Data Error", "order_error": str(e), "sector": "ERROR"} for t in targets]
         return error_results, scan_time, analysis_mode, list_file
 
-    results = []
-    new_cache = []
-
-    for ticker in targets:
-        try:
-            df = all_data[ticker] if len(targets) > 1 else all_data
-            if df.empty or df.isnull().all().all(): raise ValueError("DataFrame for this ticker is empty.")
-            df.dropna(inplace=True)
-            if df.empty: raise ValueError("DataFrame is empty after dropping NaNs.")
-
-            if mode == 'QUICK_SCAN':
-                if len(df) < 2: continue
-                last_day = df.iloc[-1]
-                prev_day = df.iloc[-2]
-                is_red = last_day['Close'] > last_day['Open']
-                is_volume_up = last_day['Volume'] > (prev_day['Volume'] * 1.2)
-                if not (is_red and is_volume_up): continue
-            
-            last = df.iloc[-1]
-            last_p = float(last['Close'])
-            best_p, fit_val = 20, "N/A"
-
-            if analysis_mode == 'WEEKLY':
-                battle = []
-                for p in [10, 20, 60]:
-                    df_strat = df[['Close']].copy()
-                    df_strat['ma'] = df_strat['Close'].rolling(p).mean()
-                    df_strat.dropna(inplace=True)
-                    if df_strat.empty: continue
-                    df_strat['above_ma'] = (df_strat['Close'] > df_strat['ma']).astype(int)
-                    df_strat['signal_change'] = df_strat['above_ma'].diff()
-                    df_strat['buy_price'] = np.where(df_strat['signal_change'] == 1, df_strat['Close'], np.nan)
-                    df_strat['entry_price_held'] = df_strat['buy_price'].ffill()
-                    trades = df_strat[df_strat['signal_change'] == -1]
-                    trade_profits_pct = []
-                    if not trades.empty and not trades['entry_price_held'].isnull().all():
-                         trade_profits_pct = ((trades['Close'] - trades['entry_price_held']) / trades['entry_price_held'] - 0.004).tolist()
-                    if not df_strat.empty and df_strat['above_ma'].iloc[-1] == 1:
-                        last_buy_idx = df_strat[df_strat['signal_change'] == 1].index
-                        if not last_buy_idx.empty:
-                            entry_price_open = df_strat.loc[last_buy_idx[-1], 'Close']
-                            exit_price_open = df_strat['Close'].iloc[-1]
-                            if entry_price_open != 0: trade_profits_pct.append((exit_price_open - entry_price_open) / entry_price_open - 0.004)
-                    current_capital = 100.0 * np.prod([1 + prof for prof in trade_profits_pct])
-                    battle.append((p, current_capital))
-                if not battle: raise ValueError("Could not perform weekly backtest.")
-                best_p, f_raw = sorted(battle, key=lambda x: x[1], reverse=True)[0]
-                fit_val = f"{f_raw-100:.1f}%"
-                new_cache.append({'ticker': ticker, 'best_p': best_p, 'fit': fit_val})
-            else: # DAILY
-                if ticker in cache_df.index:
-                    best_p = int(cache_df.loc[ticker, 'best_p'])
-                    fit_val = cache_df.loc[ticker, 'fit']
-
-            low_20 = df['Low'].tail(20).min()
-            target_1382 = round(low_20 + (last_p - low_20) * 1.382, 2)
-            ma_val = df['Close'].rolling(best_p).mean().iloc[-1]
-            status = "✅強勢" if last_p > ma_val else "❌弱勢"
-            is_red_signal = last_p > last['Open']
-            signal = "🟢🟢 埋伏" if (is_red_signal and len(df['Volume']) > 1 and last['Volume'] > df['Volume'].iloc[-2] and status == "✅強勢") else "⚪ 觀察"
-            display_name = f"{get_sector_label(ticker)}{ticker}"
-
-            results.append({"name": display_name, "p": f"{best_p}d", "fit": fit_val,
-                           "price": f"{last_p:.1f}", "target": target_1382, "status": status,
-                           "signal": signal, "sector": get_sector_label(ticker)})
-
-        except Exception as e:
-            logging.error(f"ANALYSIS ERROR on {ticker}: {e}", exc_info=False)
-            results.append({"name": f"分析失敗: {ticker}", "p": "N/A", "fit": "N/A", "price": "N/A", "target": "N/A", "status": "🔴 錯誤", "signal": "Data Error", "order_error": str(e), "sector": "ERROR"})
-            continue
-    
+    if mode == 'QUICK_SCAN' and len(targets) > 1:
+        candidates = quick_scan_candidates(all_data, targets)
+        logging.info(f"QUICK_SCAN pre-filter kept {len(candidates)} of {len(targets)} targets.")
+        targets = candidates
+        if not targets: return [], scan_time, analysis_mode, list_file
+
+    price_arrays = split_price_arrays(all_data, targets)
+    gene_cache = load_gene_cache()
+    with ThreadPoolExecutor(max_workers=min(ANALYSIS_WORKERS, len(targets))) as ex:
+        outcomes = list(ex.map(lambda t: analyze_ticker(t, price_arrays[t], mode, analysis_mode, gene_cache), targets))
+    results = [r for r, _ in outcomes if r is not None]
+    new_cache = {t: c for t, (_, c) in zip(targets, outcomes) if c is not None}
+
     if new_cache:
         logging.info(f"Updating gene cache with {len(new_cache)} new entries.")
-        new_df = pd.DataFrame(new_cache).set_index('ticker')
-        updated_cache_df = pd.concat([cache_df[~cache_df.index.isin(new_df.index)], new_df])
-        updated_cache_df.to_csv(GENE_CACHE_FILE)
+        _persist_pool.submit(_persist_gene_cache, new_cache) # Off the request path; the single worker keeps saves in order.
         
     return results, scan_time, analysis_mode, list_file
 
+_run_cache = {}
+_run_cache_lock = threading.Lock()
+
+def _run_cache_key(mode):
+    # WEEKLY scans write the gene cache (in the background) rather than read it, so its mtime is only part of the key for modes that consume it.
+    gene_stamp = None if mode in ('WEEKLY', 'MARKET_BACKTEST') else _mtime(GENE_CACHE_FILE)
+    return (mode, _mtime(WATCHLIST_FILE), _mtime(MARKET_SCAN_LIST_FILE), gene_stamp)
+
+def get_hunter_results(mode):
+    """run_stable_hunter behind a short TTL cache. Keyed on the input files' mtimes so an edited
+    watchlist or refreshed gene cache is never served stale; failed scans are not cached."""
+    init_system_files()
+    ensure_list_file(mode) # Create inputs before keying, so the key matches what the scan reads.
+    key = _run_cache_key(mode)
+    with _run_cache_lock:
+        hit = _run_cache.get(key)
+    if hit and time.time() - hit[0] < RUN_CACHE_TTL:
+        logging.info(f"Serving {mode} results from run cache.")
+        results, scan_time, analysis_mode, list_file = hit[1]
+        return list(results), scan_time, analysis_mode, list_file
+
+    outcome = run_stable_hunter(mode=mode)
+    if not any(r.get("sector") == "ERROR" for r in outcome[0]): # Stored under the pre-scan key: a file edited mid-scan must miss next time.
+        with _run_cache_lock:
+            for k in [k for k, v in _run_cache.items() if time.time() - v[0] >= RUN_CACHE_TTL]: del _run_cache[k]
+            _run_cache[key] = (time.time(), outcome)
+    results, scan_time, analysis_mode, list_file = outcome
+    return list(results), scan_time, analysis_mode, list_file
+
 # ================= 3. Flask Web Routes (DIRECT STRIKE PROTOCOL) =================
 @app.route('/')
 def index():
@@ -196,19 +460,19 @@ def run_analysis(mode):
     }
     title = titles.get(mode_upper, '📊 分析結果')
 
-    data, scan_time, analysis_mode, list_file = run_stable_hunter(mode=mode_upper)
+    data, scan_time, analysis_mode, list_file = get_hunter_results(mode_upper)
     error_flag = any("ERROR" in r.get("sector", "") for r in data)
     
     if mode_upper == 'MARKET_BACKTEST' and not error_flag:
-        data.sort(key=lambda r: float(r['fit'].replace('%', '')) if r.get('fit') and r['fit'] != 'N/A' else -9999, reverse=True)
+        data.sort(key=lambda r: float(r['fit'].replace('%', '')) if r.get('fit', '').endswith('%') else -9999, reverse=True)
 
-    buys = [r['sector'] for r in data if r.get('signal') == "🟢🟢 埋伏" and r.get('sector') != "[熱門]" and not "ERROR" in r.get('sector', "")]
+    buy_counts = Counter(r['sector'] for r in data if r.get('signal') == "🟢🟢 埋伏" and r.get('sector') != "[熱門]" and not "ERROR" in r.get('sector', ""))
     final_table = []
     for r in data:
         if r.get("sector") == "ERROR":
             final_table.append([r['name'], r['p'], r['fit'], r['price'], r['target'], r['status'], r['signal'], r.get('order_error', 'Unknown Error')])
         else:
-            prefix = "🔥🔥【族群起漲!】" if buys.count(r['sector']) >= 2 and r['sector'] != "[熱門]" else ""
+            prefix = "🔥🔥【族群起漲!】" if buy_counts[r['sector']] >= 2 else "" # [熱門] is never counted.
             order = f"{prefix}🎯【買入】看 {r['target']}" if r['signal'] == "🟢🟢 埋伏" else "🚀【持有】"
             if r['status'] == "❌弱勢": order = "🔴【避開】趨勢空"
             final_table.append([r['name'], r['p'], r['fit'], r['price'], r['target'], r['status'], r['signal'], order])
@@ -216,7 +480,7 @@ def run_analysis(mode):
     headers = ["標的/族群", "基因", "5年戰績", "現價", "1.382預判", "狀態", "訊號", "👉 獵人作戰指令"]
     report_info = ""
     if mode_upper == 'WEEKLY':
-        report_info = "每週分析完成，基因快取已更新。"
+        report_info = "每週分析完成，基因快取更新中。"
     elif mode_upper == 'QUICK_SCAN':
         # Filter out errors before counting for a more accurate report
         successful_targets = [d for d in data if d.get("sector") != "ERROR"]
@@ -244,37 +508,41 @@ def manage_watchlist():
         content = "# 請在此輸入您的自選股\n2330.TW\n" # Default content
         with open(WATCHLIST_FILE, "w", encoding="utf-8") as f: f.write(content)
 
-    tickers = [l.strip() for l in content.splitlines() if l.strip() and not l.startswith("#")]
-    ticker_details = [{'ticker': t, 'name': t} for t in tickers] # Removed get_stock_name
+    tickers = list(_parse_ticker_lines(content.splitlines())) # Parse the text already read instead of reopening the file.
+    ticker_details = [{'ticker': t, 'name': get_stock_name(t)} for t in tickers]
     
     return render_template('watchlist.html', content=content, ticker_details=ticker_details)
 
 @app.route('/download/<mode>')
 def download_csv(mode):
-    results, _, _, _ = run_stable_hunter(mode=mode.upper())
+    results, _, _, _ = get_hunter_results(mode.upper())
     
     if any("ERROR" in r.get("sector", "") for r in results):
         headers = ["分析狀態", "詳細錯誤"]
-        csv_data = [[r['name'], r.get('order_error', 'N/A')] for r in results]
+        rows = ([r['name'], r.get('order_error', 'N/A')] for r in results)
     else:
         headers = ["標的", "基因", "5年戰績", "現價", "1.382預判", "狀態", "訊號"]
-        csv_data = []
-        for r in results:
-            csv_data.append([r['name'], r['p'], r['fit'], r['price'], r['target'], r['status'], r['signal']])
+        rows = ([r['name'], r['p'], r['fit'], r['price'], r['target'], r['status'], r['signal']] for r in results) # Built lazily, one row per chunk.
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        buf.write("\ufeff") # UTF-8 BOM so Excel opens the Chinese headers correctly.
+        writer.writerow(headers)
+        yield buf.getvalue()
+        for row in rows:
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow(row)
+            yield buf.getvalue()
 
-    df = pd.DataFrame(csv_data, columns=headers)
-    
-    output = io.BytesIO()
-    df.to_csv(output, index=False, encoding='utf-8-sig')
-    output.seek(0)
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
     return Response(
-        output,
+        generate(),
         mimetype="text/csv",
         headers={"Content-Disposition": f"attachment;filename={mode.lower()}_scan_{timestamp}.csv"}
     )
 
 # ================= Main Entry Point for Local Server =================
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8081, debug=True)
+    app.run(host='0.0.0.0', port=8081)
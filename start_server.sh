@@ -13,4 +13,4 @@ echo "Starting Flask web server on http://127.0.0.1:8080"
 echo "You can now open a web browser and go to http://127.0.0.1:8080"
 echo "Press CTRL+C in this window to stop the server."
 echo ""
-python main.py
+gunicorn -c gunicorn_conf.py main:app